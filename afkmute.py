@@ -1,10 +1,10 @@
 import asyncio
-import dataclasses
 import logging
 from dataclasses import dataclass
 import dotenv
 import hikari
 import lightbulb
+import operator
 import os
 from pathlib import Path
 import typing as t
@@ -19,23 +19,121 @@ def get_token() -> str:
     return os.environ["BOT_TOKEN"]
 
 
-def generate_invite(bot: hikari.GatewayBot) -> str:
-    return f"https://discord.com/api/oauth2/authorize?client_id={bot.get_me().id}&permissions=4194304&scope=bot%20applications.commands"
+# The bot's own id never changes, so the invite URL is computed once in
+# on_started rather than per /invite invocation.
+_invite_url: t.Optional[str] = None
 
 
-@dataclass
+# Guild member edits share a very small rate limit bucket on Discord's side
+# (5 requests per 5 seconds), so cap in-flight mute edits and back off on 429s
+# instead of letting a burst of them stall whichever task issued the edit.
+MUTE_EDIT_MAX_RETRIES = 3
+
+_mute_edit_sem = asyncio.Semaphore(5)
+
+
+async def edit_member_mute(member: hikari.Member, mute: bool) -> None:
+    async with _mute_edit_sem:
+        delay = 0.5
+
+        for _ in range(MUTE_EDIT_MAX_RETRIES):
+            try:
+                await member.edit(mute=mute)
+                return
+            except hikari.RateLimitedError as e:
+                await asyncio.sleep(max(e.retry_after, delay))
+                delay = min(delay * 2, 4.0)
+
+        # Out of retries, let any error propagate to the caller.
+        await member.edit(mute=mute)
+
+
+@dataclass(frozen=True, slots=True)
 class AfkMuteInfo:
     user_id: int
     muter_id: int
 
     def as_dict(self) -> t.MutableMapping[str, saru.ConfigValue]:
-        return dataclasses.asdict(self)
+        # dataclasses.asdict would deep-copy its way through two ints.
+        return {"user_id": self.user_id, "muter_id": self.muter_id}
+
+
+# How long config writes are allowed to accumulate before being flushed.
+CFG_FLUSH_DELAY_SECS = 0.25
+
+# Config keys are stringified user ids. The set of users ever afk-muted is
+# small, so memoize the int -> str conversion in a bounded cache instead of
+# re-stringifying a 64-bit snowflake on every write.
+_KEY_CACHE_MAX = 1024
+_key_cache: t.Dict[int, str] = {}
+
+
+def cfg_key(user_id: int) -> str:
+    key = _key_cache.get(user_id)
+    if key is None:
+        if len(_key_cache) >= _KEY_CACHE_MAX:
+            _key_cache.clear()
+
+        key = _key_cache[user_id] = str(user_id)
+
+    return key
 
 
 @saru.config_backed("g/afk_mute_users")
 class AfkMuteState(saru.GuildStateBase):
+    # Bounds concurrent member fetches during reconciliation. Created lazily so
+    # it's always bound to the running event loop.
+    _sem: t.Optional[asyncio.Semaphore] = None
+
+    # Pending config mutations ((key, value) pairs, value None meaning delete)
+    # plus the background task that flushes them. Mutations are coalesced so a
+    # burst of mutes/unmutes doesn't serialize the handlers behind the config
+    # layer's persistence. All created lazily on the first write.
+    _pending_ops: t.Optional[t.List[t.Tuple[str, t.Optional[t.MutableMapping[str, saru.ConfigValue]]]]] = None
+    _dirty: t.Optional[asyncio.Event] = None
+    _flush_task: t.Optional["asyncio.Task[None]"] = None
+
+    # Int-keyed mirror of the cfg keys, maintained alongside every cfg write.
+    # Membership tests run on every gateway event, so they should be a plain
+    # set lookup rather than a str() conversion plus a config-layer lookup.
+    _muted_ids: t.Optional[t.Set[int]] = None
+
+    @property
+    def muted_ids(self) -> t.Set[int]:
+        if self._muted_ids is None:
+            self._muted_ids = {int(key) for key in self.cfg.opts}
+
+        return self._muted_ids
+
     def is_afk_mute(self, user: hikari.Member) -> bool:
-        return str(user.id) in self.cfg
+        return user.id in self.muted_ids
+
+    def is_afk_mute_id(self, user_id: int) -> bool:
+        return user_id in self.muted_ids
+
+    def _queue_cfg_write(self, key: str, value: t.Optional[t.MutableMapping[str, saru.ConfigValue]]) -> None:
+        if self._pending_ops is None:
+            self._pending_ops = []
+            self._dirty = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+        self._pending_ops.append((key, value))
+        self._dirty.set()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._dirty.wait()
+
+            # Let a burst of writes accumulate, then apply them all at once.
+            await asyncio.sleep(CFG_FLUSH_DELAY_SECS)
+            self._dirty.clear()
+
+            ops, self._pending_ops = self._pending_ops, []
+            for key, value in ops:
+                if value is None:
+                    self.cfg.delete(key)
+                else:
+                    self.cfg.set(key, value)
 
     def is_user_in_vc(self, user: hikari.Member) -> bool:
         return self.guild.get_voice_state(user) is not None
@@ -45,13 +143,14 @@ class AfkMuteState(saru.GuildStateBase):
             raise UserAlreadyAfkMuteError()
 
         if self.is_user_in_vc(user):
-            await user.edit(mute=True)
+            await edit_member_mute(user, True)
 
         i = AfkMuteInfo(
             user_id=user.id,
             muter_id=muter.id
         )
-        self.cfg.set(str(user.id), i.as_dict())
+        self._queue_cfg_write(cfg_key(user.id), i.as_dict())
+        self.muted_ids.add(user.id)
 
         return i
 
@@ -63,19 +162,46 @@ class AfkMuteState(saru.GuildStateBase):
             raise UserNotInVcError()
 
         if not no_vc_ok:
-            await user.edit(mute=False)
+            await edit_member_mute(user, False)
+
+        self._queue_cfg_write(cfg_key(user.id), None)
+        self.muted_ids.discard(user.id)
+
+    def _vs_snapshot(self) -> t.Mapping[hikari.Snowflake, hikari.VoiceState]:
+        # When iterating many users, index one snapshot of the voice states
+        # instead of walking the guild cache per user.
+        return self.guild.get_voice_states()
+
+    async def _reconcile_one(
+        self,
+        app: hikari.RESTAware,
+        user_id: int,
+        voice_state: t.Optional[hikari.VoiceState]
+    ) -> None:
+        # If the user isn't in voice, or is still muted, there's nothing to
+        # reconcile, so don't bother resolving a member at all.
+        if voice_state is None or voice_state.is_guild_muted:
+            return
 
-        self.cfg.delete(str(user.id))
+        member = bot.cache.get_member(self.guild.id, user_id)
+        if member is None:
+            if self._sem is None:
+                self._sem = asyncio.Semaphore(16)
 
-    async def fetch_afk_mute_state(self, app: hikari.RESTAware) -> None:
-        info_items = [AfkMuteInfo(**value) for value in self.cfg.opts.values()]
+            async with self._sem:
+                member = await app.rest.fetch_member(self.guild.id, user_id)
+
+        await self.unset_afk_mute(member, no_vc_ok=True)
 
-        for info in info_items:
-            member = await app.rest.fetch_member(self.guild.id, info.user_id)
-            voice_state = self.guild.get_voice_state(member.id)
+    async def fetch_afk_mute_state(self, app: hikari.RESTAware) -> None:
+        # Only the user ids matter here, so skip building AfkMuteInfo objects
+        # just to read one field back off them.
+        user_ids = [value["user_id"] for value in self.cfg.opts.values()]
+        vs_map = self._vs_snapshot()
 
-            if voice_state is not None and not voice_state.is_guild_muted:
-                await self.unset_afk_mute(member, no_vc_ok=True)
+        await asyncio.gather(*(
+            self._reconcile_one(app, user_id, vs_map.get(user_id)) for user_id in user_ids
+        ))
 
 
 intents = (
@@ -86,7 +212,29 @@ intents = (
 )
 bot = lightbulb.BotApp(get_token(), intents=intents)
 saru.attach(bot, config_path=Path("cfg"))
-saru.get(bot).gstype(AfkMuteState)
+SARU = saru.get(bot)
+SARU.gstype(AfkMuteState)
+
+# Guild states are stable once created, so cache them here and let listeners
+# skip the async saru lookup on the hot path.
+_state_cache: t.Dict[int, AfkMuteState] = {}
+
+
+def guild_may_have_mutes(guild_id: int) -> bool:
+    # Synchronous check for listeners that want to skip work entirely. Guilds
+    # whose state hasn't been cached yet report True so the slow path can
+    # resolve (and cache) them.
+    state = _state_cache.get(guild_id)
+    return state is None or bool(state.muted_ids)
+
+
+async def get_state(guild_id: int) -> AfkMuteState:
+    state = _state_cache.get(guild_id)
+    if state is None:
+        state = await SARU.gs(AfkMuteState, guild_id)
+        _state_cache[guild_id] = state
+
+    return state
 
 
 class AfkMuteError(Exception):
@@ -105,14 +253,18 @@ class UserNotInVcError(AfkMuteError):
     pass
 
 
+# Color.from_rgb validates and packs its arguments on every call, so build
+# these once rather than per response.
+_ERR_COLOR = hikari.Color.from_rgb(255, 0, 0)
+_SUCCESS_COLOR = hikari.Color.from_rgb(0, 255, 0)
+
+
 def err_embed(error_text: str) -> hikari.Embed:
-    embed = hikari.Embed(title="Error", color=hikari.Color.from_rgb(255, 0, 0), description=error_text)
-    return embed
+    return hikari.Embed(title="Error", color=_ERR_COLOR, description=error_text)
 
 
 def success_embed(desc: str) -> hikari.Embed:
-    embed = hikari.Embed(title="Success", color=hikari.Color.from_rgb(0, 255, 0), description=desc)
-    return embed
+    return hikari.Embed(title="Success", color=_SUCCESS_COLOR, description=desc)
 
 
 @bot.command()
@@ -125,7 +277,7 @@ def success_embed(desc: str) -> hikari.Embed:
 )
 @lightbulb.implements(lightbulb.SlashCommand)
 async def invite(ctx: lightbulb.Context) -> None:
-    await ctx.respond(hikari.Embed(title="Click here to invite.", url=generate_invite(ctx.bot)))
+    await ctx.respond(hikari.Embed(title="Click here to invite.", url=_invite_url))
 
 
 @bot.command()
@@ -150,6 +302,11 @@ async def invite(ctx: lightbulb.Context) -> None:
 async def afkmute(ctx: lightbulb.Context) -> None:
     target: hikari.Member = ctx.options.user
 
+    # Bots never go AFK; reject before touching the state store or REST.
+    if target.is_bot:
+        await ctx.respond(err_embed("Cannot afk-mute bots."), flags=hikari.MessageFlag.EPHEMERAL)
+        return
+
     try:
         state = await AfkMuteState.get(ctx)
         await state.set_afk_mute(target, ctx.member)
@@ -189,53 +346,108 @@ async def unafkmute(ctx: lightbulb.Context) -> None:
     await ctx.respond(success_embed("You have been unmuted."), flags=hikari.MessageFlag.EPHEMERAL)
 
 
+# Event handlers run on a small worker pool rather than inline on the gateway
+# dispatch task, so a slow (e.g. rate-limited) mute edit can't stall event
+# dispatch. If the queue backs up, new events are dropped rather than applying
+# backpressure to the gateway.
+WORKER_COUNT = 8
+WORK_QUEUE_SIZE = 1024
+HANDLER_TIMEOUT_SECS = 30
+
+EventHandler = t.Callable[[t.Any], t.Awaitable[None]]
+
+_work_q: "asyncio.Queue[t.Tuple[EventHandler, hikari.Event]]" = asyncio.Queue(maxsize=WORK_QUEUE_SIZE)
+_worker_tasks: t.List["asyncio.Task[None]"] = []
+
+
+def enqueue_event(handler: EventHandler, event: hikari.Event) -> None:
+    try:
+        _work_q.put_nowait((handler, event))
+    except asyncio.QueueFull:
+        logger.warning("Event queue full, dropping %s.", type(event).__name__)
+
+
+async def event_worker() -> None:
+    while True:
+        handler, event = await _work_q.get()
+
+        try:
+            await asyncio.wait_for(handler(event), timeout=HANDLER_TIMEOUT_SECS)
+        except Exception:
+            logger.exception("Error while handling %s.", type(event).__name__)
+        finally:
+            _work_q.task_done()
+
+
+# Status changes that can only be invoked by the user.
+# Unfortunately, channel_id doesn't count, because it can be changed by an administrator, and there's
+# no reliable way to tell *who* changed the channel ID.
+USER_STATUS = (
+    "is_self_deafened",
+    "is_self_muted",
+    "is_streaming",
+    "is_video_enabled"
+)
+
+# Extracts all user status fields as one tuple, so comparing two voice states
+# is a single C-level tuple comparison rather than a loop of getattr calls.
+_get_user_status = operator.attrgetter(*USER_STATUS)
+
+
 @bot.listen(hikari.VoiceStateUpdateEvent)
 async def on_voice_state_update(event: hikari.VoiceStateUpdateEvent) -> None:
-    state: AfkMuteState = await saru.get(bot).gs(AfkMuteState, event.guild_id)
+    enqueue_event(handle_voice_state_update, event)
 
-    # If a user marked as afk-mute is unmuted manually, make sure to remove the cfg entry.
+
+async def handle_voice_state_update(event: hikari.VoiceStateUpdateEvent) -> None:
+    old = event.old_state
+    new = event.state
+
+    # Did someone manually unmute a user?
     manually_unmuted = (
-        event.old_state is not None and
-        event.old_state.is_guild_muted and
-        not event.state.is_guild_muted
+        old is not None and
+        old.is_guild_muted and
+        not new.is_guild_muted
     )
-    if manually_unmuted and state.is_afk_mute(event.state.member):
-        await state.unset_afk_mute(event.state.member)
+
+    # Did the user just join voice?
+    joined_vc = old is None and new.channel_id is not None
+
+    # Did a user-invoked status change occur?
+    status_changed = old is not None and _get_user_status(old) != _get_user_status(new)
+
+    # This handler runs for every voice state change in every guild, so filter out
+    # irrelevant updates (channel moves, etc.) before touching the state store at all.
+    if not (manually_unmuted or joined_vc or status_changed):
         return
 
-    # Next, check if the user just joined voice. If so, update their voice state to be in line with
-    # the afk-mute.
-    joined_vc = (
-        event.old_state is None and
-        event.state.channel_id is not None
-    )
-    if joined_vc and state.is_afk_mute(event.state.member) and not event.state.is_guild_muted:
-        await event.state.member.edit(mute=True)
+    state = _state_cache.get(event.guild_id)
+    if state is None:
+        state = await get_state(event.guild_id)
 
-    # However, for the opposite, not afk-muted but server muted, we should *not* update the state. They could have
-    # been forcibly muted external to our application.
+    # Every branch below only applies to afk-muted users, so check once up front.
+    # This also covers the common case of guilds with no afk-muted users at all.
+    member = new.member
+    if not state.is_afk_mute_id(new.user_id):
+        return
 
-    # If nothing to compare to, don't bother.
-    if event.old_state is None:
+    # If a user marked as afk-mute is unmuted manually, make sure to remove the cfg entry.
+    if manually_unmuted:
+        await state.unset_afk_mute(member)
         return
 
-    # Otherwise, check for some status changes that can only be invoked by the user. If any have occurred,
-    # unmute the user.
-    # Unfortunately, channel_id doesn't count, because it can be changed by an administrator, and there's
-    # no reliable way to tell *who* changed the channel ID.
-    user_status = [
-        "is_self_deafened",
-        "is_self_muted",
-        "is_streaming",
-        "is_video_enabled"
-    ]
-    for status in user_status:
-        prev: bool = getattr(event.old_state, status)
-        cur: bool = getattr(event.state, status)
+    # If the user just joined voice, update their voice state to be in line with the afk-mute.
+    if joined_vc:
+        if not new.is_guild_muted:
+            await edit_member_mute(member, True)
 
-        if prev != cur:
-            await state.unset_afk_mute(event.state.member)
-            return
+        # However, for the opposite, not afk-muted but server muted, we should *not* update the
+        # state. They could have been forcibly muted external to our application.
+        return
+
+    # Otherwise, a user-invoked status change has occurred, so unmute the user.
+    if status_changed:
+        await state.unset_afk_mute(member)
 
 
 @bot.listen(
@@ -249,11 +461,36 @@ async def on_member_message_action(
         hikari.GuildMessageUpdateEvent,
         hikari.GuildReactionEvent
     ]
+) -> None:
+    # Message and reaction events vastly outnumber afk-muted users; don't even
+    # enqueue work for guilds known to have no mutes.
+    if not guild_may_have_mutes(event.guild_id):
+        return
+
+    enqueue_event(handle_member_message_action, event)
+
+
+async def handle_member_message_action(
+    event: t.Union[
+        hikari.GuildMessageCreateEvent,
+        hikari.GuildMessageUpdateEvent,
+        hikari.GuildReactionEvent
+    ]
 ) -> None:
     # Unmute on message updates. Delete is not included because it can be invoked by some other user.
-    state: AfkMuteState = await saru.get(bot).gs(AfkMuteState, event.guild_id)
+    state = _state_cache.get(event.guild_id)
+    if state is None:
+        state = await get_state(event.guild_id)
+
+    if not state.muted_ids:
+        return
 
     if isinstance(event, hikari.GuildReactionEvent):
+        # Check the raw id before resolving anything, so reactions from
+        # non-muted users don't construct a Member object at all.
+        if not state.is_afk_mute_id(event.user_id):
+            return
+
         member = bot.cache.get_member(event.guild_id, event.user_id)
     else:
         member = event.member
@@ -267,20 +504,41 @@ async def on_member_message_action(
 
 @bot.listen(hikari.StartedEvent)
 async def on_started(event: hikari.StartedEvent) -> None:
-    s = saru.get(bot)
+    global _invite_url
+    _invite_url = (
+        "https://discord.com/api/oauth2/authorize"
+        f"?client_id={(await bot.rest.fetch_my_user()).id}&permissions=4194304&scope=bot%20applications.commands"
+    )
 
-    for _ in range(10):
-        await asyncio.sleep(1)
-        if s.is_ready:
-            logger.info("Saru ready, updating mute state.")
-            break
-    else:
+    if not _worker_tasks:
+        _worker_tasks.extend(asyncio.create_task(event_worker()) for _ in range(WORKER_COUNT))
+
+    # Saru doesn't expose a readiness event to wait on, so poll with
+    # exponential backoff: near-instant pickup when saru is ready right away,
+    # and no more than one check per second while it isn't.
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + 10
+    delay = 0.01
+
+    while not SARU.is_ready and loop.time() < deadline:
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+    if not SARU.is_ready:
         logger.error("Saru not ready in 10 secs, considering this failure.")
         return
 
-    for guild in (await bot.rest.fetch_my_guilds()):
-        gs: AfkMuteState = await s.gs(AfkMuteState, guild.id)
+    logger.info("Saru ready, updating mute state.")
+
+    async def reconcile(guild: hikari.OwnGuild) -> None:
+        gs = await get_state(guild.id)
         await gs.fetch_afk_mute_state(event.app)
 
+    guilds = await bot.rest.fetch_my_guilds()
+
+    async with asyncio.TaskGroup() as tg:
+        for guild in guilds:
+            tg.create_task(reconcile(guild))
+
 
 bot.run()